@@ -1,14 +1,23 @@
 import asyncio
+import json
+import sys
+import threading
 import time
-from dataclasses import asdict, dataclass
-from typing import Awaitable, Callable, Dict, Optional, Union
+from collections import OrderedDict, deque
+from dataclasses import dataclass, fields
+from itertools import islice
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Iterator, Optional, Union
 
 from aioapns import APNs, ConnectionError, NotificationRequest, PushType
 from aioapns.common import NotificationResult
+from aioapns.exceptions import MaxAttemptsExceeded
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured
 
 from . import models
 from .conf import get_manager
 from .exceptions import APNSServerError
+from .settings import PUSH_NOTIFICATIONS_SETTINGS as SETTINGS
 
 ErrFunc = Optional[Callable[[NotificationRequest, NotificationResult], Awaitable[None]]]
 """function to proces errors from aioapns send_message"""
@@ -19,23 +28,34 @@ class NotSet:
 		raise RuntimeError("NotSet cannot be instantiated")
 
 
+# slots=True is only supported by dataclasses from Python 3.10
+_DATACLASS_OPTIONS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
 class Credentials:
-	pass
+	__slots__ = ()
 
+	def to_kwargs(self) -> dict[str, any]:
+		"""
+		Returns the keyword arguments to pass to aioapns.APNs, one per dataclass
+		field of the credentials.
+		"""
+		return {field.name: getattr(self, field.name) for field in fields(self)}
 
-@dataclass
+
+@dataclass(**_DATACLASS_OPTIONS)
 class TokenCredentials(Credentials):
 	key: str
 	key_id: str
 	team_id: str
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class CertificateCredentials(Credentials):
 	client_cert: str
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class Alert:
 	"""
 	The information for displaying an alert. A dictionary is recommended. If you specify a string, the alert displays your string as the body text.
@@ -102,17 +122,210 @@ class Alert:
 	A dictionary that contains sound information for critical alerts. For regular notifications, use the sound string instead.
 	"""
 
+	_FIELD_MAP = {
+		"title": "title",
+		"subtitle": "subtitle",
+		"body": "body",
+		"launch_image": "launch-image",
+		"title_loc_key": "title-loc-key",
+		"title_loc_args": "title-loc-args",
+		"subtitle_loc_key": "subtitle-loc-key",
+		"subtitle_loc_args": "subtitle-loc-args",
+		"loc_key": "loc-key",
+		"loc_args": "loc-args",
+		"sound": "sound",
+	}
+	"""maps attribute names to their key in the APNS payload"""
+
 	def asDict(self) -> dict[str, any]:
-		python_dict = asdict(self)
-		return {
-			key.replace("_", "-"): value
-			for key, value in python_dict.items()
-			if value is not NotSet
-		}
+		out = {}
+		for attr, key in self._FIELD_MAP.items():
+			value = getattr(self, attr)
+			if value is not NotSet:
+				out[key] = value
+		return out
+
+
+def _new_event_loop() -> asyncio.AbstractEventLoop:
+	if SETTINGS["APNS_USE_UVLOOP"]:
+		try:
+			import uvloop
+		except ImportError:
+			raise ImproperlyConfigured(
+				"APNS_USE_UVLOOP is enabled but uvloop is not installed"
+			)
+		return uvloop.new_event_loop()
+	return asyncio.new_event_loop()
+
+
+def _get_current_event_loop() -> Optional[asyncio.AbstractEventLoop]:
+	try:
+		return asyncio.get_event_loop()
+	except RuntimeError:
+		return None
+
+
+def _get_event_loop() -> asyncio.AbstractEventLoop:
+	"""
+	Returns the running event loop if called from a coroutine, or the thread's
+	current event loop if it has one that is not closed. Otherwise returns the
+	loop the sync API runs on, which is created once per thread and reused for
+	all sends (and their cached clients) from that thread.
+	"""
+	try:
+		return asyncio.get_running_loop()
+	except RuntimeError:
+		pass
+
+	loop = _get_current_event_loop()
+	if loop is not None and not loop.is_closed():
+		return loop
+
+	thread = threading.current_thread()
+	thread_loop = _THREAD_LOOPS.get(thread)
+	if thread_loop is None or thread_loop[0].is_closed():
+		thread_loop = _THREAD_LOOPS[thread] = (_new_event_loop(), [])
+	return thread_loop[0]
+
+
+CLIENT_CACHE_SIZE = 32
+"""maximum number of APNsService instances cached per event loop"""
+
+THREAD_LOOP_CLOSE_TIMEOUT = 5
+"""time in seconds given to the connections of an exited thread to close"""
+
+_CLIENT_CACHE: "OrderedDict[tuple, APNsService]" = OrderedDict()
+_CLIENT_CACHE_LOCK = threading.Lock()
+
+_THREAD_LOOPS: "dict[threading.Thread, tuple[asyncio.AbstractEventLoop, list]]" = {}
+"""
+event loops created by _get_event_loop() for the sync API, by thread, with the
+services created on them that may still have open connections
+"""
+
+
+def _close_thread_loop(loop: asyncio.AbstractEventLoop, services: "list[APNsService]"):
+	"""
+	Closes the connections of the services created on the event loop of a thread
+	that has exited, then the loop itself. The loop is run here, as its thread
+	will not run it anymore (and so neither will aioapns' inactivity timers).
+	"""
+	async def close():
+		for service in services:
+			service.client.pool.close()
+		# aioapns removes the connections from their pool once they are closed
+		while any(service.client.pool.connections for service in services):
+			await asyncio.sleep(0.01)
+
+	try:
+		loop.run_until_complete(asyncio.wait_for(close(), THREAD_LOOP_CLOSE_TIMEOUT))
+	except asyncio.TimeoutError:
+		pass
+	finally:
+		loop.close()
+
+
+def _evict_client(apns_service: "APNsService"):
+	"""
+	Removes apns_service from the client cache so that later sends use a fresh
+	client. Its connections are not closed, as other callers may still be
+	sending with it; aioapns closes them once they are idle.
+	"""
+	with _CLIENT_CACHE_LOCK:
+		for key, service in list(_CLIENT_CACHE.items()):
+			if service is apns_service:
+				del _CLIENT_CACHE[key]
 
 
 class APNsService:
-	__slots__ = ("client",)
+	__slots__ = ("client", "_loop")
+
+	@classmethod
+	def get_or_create(
+		cls,
+		application_id: str = None,
+		creds: Credentials = None,
+		topic: str = None,
+		err_func: ErrFunc = None,
+		connections: int = None,
+	) -> "APNsService":
+		"""
+		Returns a cached APNsService for the given configuration, creating it if
+		needed, so that the underlying HTTP/2 connections are reused across sends.
+		"""
+		if topic is None:
+			topic = get_manager().get_apns_topic(application_id)
+		if creds is None:
+			creds = cls._get_credentials(application_id)
+		use_sandbox = get_manager().get_apns_use_sandbox(application_id)
+
+		key = (
+			application_id,
+			topic,
+			type(creds),
+			tuple(creds.to_kwargs().items()),
+			use_sandbox,
+			err_func,
+			connections,
+			# aioapns connections are bound to the loop they were created on
+			_get_event_loop(),
+		)
+		with _CLIENT_CACHE_LOCK:
+			exited_thread_loops = [
+				_THREAD_LOOPS.pop(thread) for thread in list(_THREAD_LOOPS)
+				if not thread.is_alive()
+			]
+			exited_loops = {loop for loop, _ in exited_thread_loops}
+			# services whose loop was closed (e.g. by asyncio.run()) are unusable,
+			# and those of exited threads will not be used anymore
+			for cached_key, cached in list(_CLIENT_CACHE.items()):
+				if cached._loop.is_closed() or cached._loop in exited_loops:
+					del _CLIENT_CACHE[cached_key]
+
+			service = _CLIENT_CACHE.get(key)
+			if service is None:
+				service = cls(
+					application_id=application_id,
+					creds=creds,
+					topic=topic,
+					err_func=err_func,
+					connections=connections,
+				)
+				_CLIENT_CACHE[key] = service
+				cls._evict_least_recently_used(service._loop)
+
+				thread_loop = _THREAD_LOOPS.get(threading.current_thread())
+				if thread_loop is not None and thread_loop[0] is service._loop:
+					# Evicted services are kept until their connections are
+					# closed, in case the thread exits before they are.
+					cached_services = set(_CLIENT_CACHE.values())
+					thread_loop[1][:] = [
+						thread_service for thread_service in thread_loop[1]
+						if thread_service in cached_services or thread_service.client.pool.connections
+					]
+					thread_loop[1].append(service)
+			else:
+				_CLIENT_CACHE.move_to_end(key)
+
+		for loop, services in exited_thread_loops:
+			if not loop.is_closed():
+				# Closing the connections waits for the server, which the caller
+				# does not need to wait for.
+				threading.Thread(
+					target=_close_thread_loop, args=(loop, services), daemon=True
+				).start()
+		return service
+
+	@staticmethod
+	def _evict_least_recently_used(loop: asyncio.AbstractEventLoop):
+		"""
+		Removes the least recently used services of the loop from the cache, so
+		that it keeps at most CLIENT_CACHE_SIZE of them. They are not closed, as
+		they may still be in use; aioapns closes their connections once idle.
+		"""
+		keys = [key for key, service in _CLIENT_CACHE.items() if service._loop is loop]
+		for key in keys[:max(len(keys) - CLIENT_CACHE_SIZE, 0)]:
+			del _CLIENT_CACHE[key]
 
 	def __init__(
 		self,
@@ -120,25 +333,39 @@ class APNsService:
 		creds: Credentials = None,
 		topic: str = None,
 		err_func: ErrFunc = None,
+		connections: int = None,
 	):
+		self._loop = _get_event_loop()
+		# aioapns binds its connection pool to asyncio.get_event_loop(), so the
+		# service's loop is made the current one while the client is built.
+		if self._loop.is_running():
+			previous_loop = self._loop
+		else:
+			previous_loop = _get_current_event_loop()
+			asyncio.set_event_loop(self._loop)
 		try:
-			loop = asyncio.get_event_loop()
-		except RuntimeError:
-			loop = asyncio.new_event_loop()
-			asyncio.set_event_loop(loop)
-
-		self.client = self._create_client(
-			creds=creds, application_id=application_id, topic=topic, err_func=err_func
-		)
+			self.client = self._create_client(
+				creds=creds,
+				application_id=application_id,
+				topic=topic,
+				err_func=err_func,
+				connections=connections,
+			)
+		finally:
+			if previous_loop is not self._loop:
+				asyncio.set_event_loop(previous_loop)
 
 	def send_message(
 		self,
 		request: NotificationRequest,
 	):
-		loop = asyncio.get_event_loop()
-		routine = self.client.send_notification(request)
-		res = loop.run_until_complete(routine)
-		return res
+		return self._loop.run_until_complete(self.send_message_async(request))
+
+	async def send_message_async(
+		self,
+		request: NotificationRequest,
+	) -> NotificationResult:
+		return await self.client.send_notification(request)
 
 	def _create_notification_request_from_args(
 		self,
@@ -146,16 +373,59 @@ class APNsService:
 		alert: Union[str, Alert],
 		badge: int = None,
 		sound: str = None,
-		extra: dict = {},
+		extra: dict = None,
 		expiration: int = None,
 		thread_id: str = None,
 		loc_key: str = None,
 		priority: int = None,
 		collapse_id: str = None,
-		aps_kwargs: dict = {},
-		message_kwargs: dict = {},
-		notification_request_kwargs: dict = {},
+		aps_kwargs: dict = None,
+		message_kwargs: dict = None,
+		notification_request_kwargs: dict = None,
 	):
+		message, notification_request_kwargs_out = self._build_message_template(
+			alert,
+			badge=badge,
+			sound=sound,
+			extra=extra,
+			expiration=expiration,
+			thread_id=thread_id,
+			loc_key=loc_key,
+			priority=priority,
+			collapse_id=collapse_id,
+			aps_kwargs=aps_kwargs,
+			message_kwargs=message_kwargs,
+			notification_request_kwargs=notification_request_kwargs,
+		)
+
+		request = NotificationRequest(
+			device_token=registration_id,
+			message=message,
+			**notification_request_kwargs_out,
+		)
+
+		return request
+
+	def _build_message_template(
+		self,
+		alert: Union[str, Alert],
+		badge: int = None,
+		sound: str = None,
+		extra: dict = None,
+		expiration: int = None,
+		thread_id: str = None,
+		loc_key: str = None,
+		priority: int = None,
+		collapse_id: str = None,
+		aps_kwargs: dict = None,
+		message_kwargs: dict = None,
+		notification_request_kwargs: dict = None,
+	) -> tuple[dict, dict]:
+		"""
+		Builds the parts of a NotificationRequest that do not depend on the
+		device token: the message payload and the remaining NotificationRequest
+		kwargs. Bulk sends build these once and share them between all requests.
+		"""
 
 		push_type = PushType.ALERT
 
@@ -171,8 +441,12 @@ class APNsService:
 		if isinstance(alert, Alert):
 			alert = alert.asDict()
 
-		notification_request_kwargs_out = notification_request_kwargs.copy()
-		notification_request_kwargs_out["push_type"] = push_type
+		if notification_request_kwargs:
+			notification_request_kwargs_out = {
+				**notification_request_kwargs, "push_type": push_type
+			}
+		else:
+			notification_request_kwargs_out = {"push_type": push_type}
 
 		if expiration is not None:
 			notification_request_kwargs_out["time_to_live"] = expiration - int(
@@ -184,23 +458,22 @@ class APNsService:
 		if collapse_id is not None:
 			notification_request_kwargs_out["collapse_key"] = collapse_id
 
-		request = NotificationRequest(
-			device_token=registration_id,
-			message={
-				"aps": {
-					"alert": alert,
-					"badge": badge,
-					"sound": sound,
-					"thread-id": thread_id,
-					**aps_kwargs,
-				},
-				**extra,
-				**message_kwargs,
-			},
-			**notification_request_kwargs_out,
-		)
+		aps = {
+			"alert": alert,
+			"badge": badge,
+			"sound": sound,
+			"thread-id": thread_id,
+		}
+		if aps_kwargs:
+			aps.update(aps_kwargs)
 
-		return request
+		message = {"aps": aps}
+		if extra:
+			message.update(extra)
+		if message_kwargs:
+			message.update(message_kwargs)
+
+		return message, notification_request_kwargs_out
 
 	def _create_client(
 		self,
@@ -208,6 +481,7 @@ class APNsService:
 		application_id: str = None,
 		topic=None,
 		err_func: ErrFunc = None,
+		connections: int = None,
 	) -> APNs:
 		use_sandbox = get_manager().get_apns_use_sandbox(application_id)
 		if topic is None:
@@ -215,15 +489,23 @@ class APNsService:
 		if creds is None:
 			creds = self._get_credentials(application_id)
 
+		client_kwargs = {}
+		if connections is not None:
+			# aioapns spreads requests over a pool of up to max_connections
+			# HTTP/2 connections, opening new ones as existing ones fill up.
+			client_kwargs["max_connections"] = connections
+
 		client = APNs(
-			**asdict(creds),
+			**creds.to_kwargs(),
 			topic=topic,  # Bundle ID
 			use_sandbox=use_sandbox,
 			err_func=err_func,
+			**client_kwargs,
 		)
 		return client
 
-	def _get_credentials(self, application_id):
+	@staticmethod
+	def _get_credentials(application_id):
 		if not get_manager().has_auth_token_creds(application_id):
 			# TLS certificate authentication
 			cert = get_manager().get_apns_certificate(application_id)
@@ -241,6 +523,212 @@ class APNsService:
 			return TokenCredentials(key=keyPath, key_id=keyId, team_id=teamId)
 
 
+MAX_PAYLOAD_SIZE = 4096
+"""maximum size in bytes of a (non-VoIP) notification payload accepted by APNS"""
+
+RETRY_BACKOFF = 0.5
+"""delay in seconds before the first retry of a notification that failed to send"""
+
+BULK_CHUNK_SIZE = 500
+"""maximum number of notifications pending at a time in bulk sends"""
+
+DEACTIVATION_BATCH_SIZE = 100
+"""number of unregistered devices deactivated per query during bulk sends"""
+
+
+def _iter_chunks(iterable: Iterable[str], size: int) -> Iterator[list[str]]:
+	iterator = iter(iterable)
+	while True:
+		chunk = list(islice(iterator, size))
+		if not chunk:
+			return
+		yield chunk
+
+
+class _ReadAhead:
+	"""
+	Iterator over the registration_ids read ahead by fill(). The sync API calls
+	fill() between runs of the event loop, so that registration_ids are read in
+	the caller's context: e.g. a queryset cannot be evaluated from the loop.
+	Iterating stops whenever nothing is read ahead, and resumes after fill().
+	"""
+
+	__slots__ = ("_iterator", "_buffer")
+
+	def __init__(self, registration_ids: Iterable[str]):
+		self._iterator = iter(registration_ids)
+		self._buffer = deque()
+
+	def fill(self, size: int):
+		self._buffer.extend(islice(self._iterator, size - len(self._buffer)))
+
+	def __iter__(self):
+		return self
+
+	def __next__(self) -> str:
+		if not self._buffer:
+			raise StopIteration
+		return self._buffer.popleft()
+
+
+def _check_bulk_options(max_concurrent: int, max_retries: int, connections: int = None):
+	if max_concurrent < 1:
+		raise ValueError("max_concurrent must be at least 1, got %r" % max_concurrent)
+	if max_retries < 0:
+		raise ValueError("max_retries must not be negative, got %r" % max_retries)
+	if connections is not None and connections < 1:
+		raise ValueError("connections must be at least 1, got %r" % connections)
+
+
+def _prepare_bulk_message(
+	alert: Union[str, Alert],
+	content_available: int = 0,
+	application_id: str = None,
+	creds: Credentials = None,
+	topic: str = None,
+	badge: int = None,
+	sound: str = None,
+	extra: dict = None,
+	thread_id: str = None,
+	loc_key: str = None,
+	priority: int = None,
+	collapse_id: str = None,
+	err_func: ErrFunc = None,
+	connections: int = None,
+):
+	"""
+	Returns the APNsService to send with, and the message and NotificationRequest
+	kwargs shared by all requests of a bulk send. The message is None if it
+	exceeds MAX_PAYLOAD_SIZE. The expiration is not part of these, as the
+	time to live has to be computed when each notification is sent.
+	"""
+
+	if topic is None:
+		topic = get_manager().get_apns_topic(application_id)
+	apns_service = APNsService.get_or_create(
+		application_id=application_id,
+		creds=creds,
+		topic=topic,
+		err_func=err_func,
+		connections=connections,
+	)
+
+	# Only the device token differs between requests, so the payload is built
+	# once and the same dict is shared by every request; aioapns only reads the
+	# message to serialize it. It has to stay a plain dict (not a read-only
+	# MappingProxyType or ChainMap view) because aioapns encodes it with
+	# json.dumps, which only accepts dict instances.
+	message, notification_request_kwargs = apns_service._build_message_template(
+		alert,
+		badge=badge,
+		sound=sound,
+		extra=extra,
+		thread_id=thread_id,
+		loc_key=loc_key,
+		priority=priority,
+		collapse_id=collapse_id,
+		aps_kwargs={'content-available': content_available}
+	)
+
+	# aioapns encodes the message again for every request; encoding it once
+	# here lets an oversized payload be rejected without sending anything.
+	payload = json.dumps(message, ensure_ascii=False).encode()
+	if len(payload) > MAX_PAYLOAD_SIZE:
+		message = None
+
+	return apns_service, message, notification_request_kwargs
+
+
+async def _send_bulk_async(
+	apns_service: APNsService,
+	registration_ids: Iterable[str],
+	message: Optional[dict],
+	notification_request_kwargs: dict,
+	expiration: int = None,
+	max_concurrent: int = 100,
+	max_retries: int = 2,
+) -> AsyncIterator[tuple[list[tuple[str, str]], list[str]]]:
+	"""
+	Sends the message to all registration_ids concurrently over the service's
+	HTTP/2 connection(s), with at most max_concurrent requests in flight at any
+	time. Notifications that could not be sent because of connection failures
+	are retried up to max_retries times with exponential backoff, and reported
+	with the error if they still fail; the other notifications are sent anyway.
+	The registration_ids are read lazily, keeping at most BULK_CHUNK_SIZE
+	notifications pending: as soon as some of them get their result, more
+	registration_ids are scheduled, so sends never wait for a whole chunk to
+	drain.
+	Yields lists of (registration_id, result) pairs as the results arrive,
+	together with the unregistered registration_ids among them. These are not
+	deactivated here: the ORM has to be used from the caller's context.
+	"""
+	if message is None:
+		for chunk in _iter_chunks(registration_ids, BULK_CHUNK_SIZE):
+			yield [(registration_id, "PayloadTooLarge") for registration_id in chunk], []
+		return
+
+	semaphore = asyncio.Semaphore(max_concurrent)
+
+	async def _send_one(request):
+		for attempt in range(max_retries + 1):
+			async with semaphore:
+				if expiration is not None:
+					# aioapns sends now + time_to_live as the expiration
+					request.time_to_live = expiration - int(time.time())
+				try:
+					return await apns_service.client.send_notification(request)
+				except (ConnectionError, MaxAttemptsExceeded) as e:
+					# aioapns reconnects on the next send; dropping the cached
+					# service makes later calls start from a fresh client too.
+					_evict_client(apns_service)
+					if attempt == max_retries:
+						return e
+			# The semaphore is released meanwhile so that other notifications
+			# can still be sent.
+			await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+	registration_ids = enumerate(registration_ids)
+	# the (index, registration_id) of each pending task
+	pending = {}
+	try:
+		while True:
+			scheduled = False
+			for index, registration_id in islice(
+				registration_ids, BULK_CHUNK_SIZE - len(pending)
+			):
+				task = asyncio.ensure_future(_send_one(NotificationRequest(
+					device_token=registration_id,
+					message=message,
+					**notification_request_kwargs,
+				)))
+				pending[task] = (index, registration_id)
+				scheduled = True
+			if not pending:
+				return
+			if scheduled:
+				# Let the new sends start before waiting on the pending ones.
+				await asyncio.sleep(0)
+
+			done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+			results = []
+			inactive_tokens = []
+			for task in sorted(done, key=pending.__getitem__):
+				_, registration_id = pending.pop(task)
+				result = task.result()
+				if isinstance(result, Exception):
+					results.append((registration_id, result.__class__.__name__))
+					continue
+				results.append((
+					registration_id, "Success" if result.is_successful else result.description
+				))
+				if not result.is_successful and result.description == "Unregistered":
+					inactive_tokens.append(registration_id)
+			yield results, inactive_tokens
+	finally:
+		for task in pending:
+			task.cancel()
+
+
 # Public interface
 
 
@@ -252,13 +740,14 @@ def apns_send_message(
 	topic: str = None,
 	badge: int = None,
 	sound: str = None,
-	extra: dict = {},
+	extra: dict = None,
 	expiration: int = None,
 	thread_id: str = None,
 	loc_key: str = None,
 	priority: int = None,
 	collapse_id: str = None,
 	err_func: ErrFunc = None,
+	defer_deactivation: list[str] = None,
 ):
 	"""
 	Sends an APNS notification to a single registration_id.
@@ -269,15 +758,21 @@ def apns_send_message(
 	it won"t be included in the notification. You will need to pass None
 	to this for silent notifications.
 
+	This runs its own event loop and must not be called from a coroutine.
+
 
 	:param registration_id: The registration_id of the device to send to
 	:param alert: The alert message to send
 	:param application_id: The application_id to use
 	:param creds: The credentials to use
+	:param defer_deactivation: If given, an unregistered registration_id is
+		appended to this list instead of being deactivated right away, so that
+		callers sending in a loop can deactivate all of them at once with
+		apns_deactivate_devices()
 	"""
 
 	try:
-		apns_service = APNsService(
+		apns_service = APNsService.get_or_create(
 			application_id=application_id, creds=creds, topic=topic, err_func=err_func
 		)
 
@@ -296,16 +791,17 @@ def apns_send_message(
 		res = apns_service.send_message(request)
 		if not res.is_successful:
 			if res.description == "Unregistered":
-				models.APNSDevice.objects.filter(
-					registration_id=registration_id
-				).update(active=False)
+				if defer_deactivation is not None:
+					defer_deactivation.append(registration_id)
+				else:
+					apns_deactivate_devices([registration_id])
 			raise APNSServerError(status=res.description)
 	except ConnectionError as e:
 		raise APNSServerError(status=e.__class__.__name__)
 
 
 def apns_send_bulk_message(
-	registration_ids: list[str],
+	registration_ids: Iterable[str],
 	alert: Union[str, Alert],
 	content_available: int = 0,
 	application_id: str = None,
@@ -313,58 +809,215 @@ def apns_send_bulk_message(
 	topic: str = None,
 	badge: int = None,
 	sound: str = None,
-	extra: dict = {},
+	extra: dict = None,
 	expiration: int = None,
 	thread_id: str = None,
 	loc_key: str = None,
 	priority: int = None,
 	collapse_id: str = None,
 	err_func: ErrFunc = None,
+	max_concurrent: int = 100,
+	max_retries: int = 2,
+	connections: int = None,
 ):
 	"""
 	Sends an APNS notification to one or more registration_ids.
-	The registration_ids argument needs to be a list.
+	The registration_ids argument can be any iterable; it is read lazily,
+	with at most BULK_CHUNK_SIZE notifications pending at a time.
+	The returned dict maps each registration_id to its result, in the order
+	the results arrived rather than the order of registration_ids.
 
 	Note that if set alert should always be a string. If it is not set,
 	it won"t be included in the notification. You will need to pass None
 	to this for silent notifications.
 
-	:param registration_ids: A list of the registration_ids to send to
+	This runs its own event loop and must not be called from a coroutine;
+	use apns_send_bulk_message_async() instead.
+
+	:param registration_ids: An iterable of the registration_ids to send to
 	:param alert: The alert message to send
 	:param application_id: The application_id to use
 	:param creds: The credentials to use
+	:param max_concurrent: The maximum number of notifications in flight at once
+	:param max_retries: The number of times a notification is retried after a
+		connection failure before it is reported as failed
+	:param connections: The maximum number of connections to APNS to spread the
+		notifications over (defaults to the aioapns pool size)
+	"""
+
+	return dict(apns_send_bulk_message_iter(
+		registration_ids,
+		alert,
+		content_available=content_available,
+		application_id=application_id,
+		creds=creds,
+		topic=topic,
+		badge=badge,
+		sound=sound,
+		extra=extra,
+		expiration=expiration,
+		thread_id=thread_id,
+		loc_key=loc_key,
+		priority=priority,
+		collapse_id=collapse_id,
+		err_func=err_func,
+		max_concurrent=max_concurrent,
+		max_retries=max_retries,
+		connections=connections,
+	))
+
+
+def apns_send_bulk_message_iter(
+	registration_ids: Iterable[str],
+	alert: Union[str, Alert],
+	content_available: int = 0,
+	application_id: str = None,
+	creds: Credentials = None,
+	topic: str = None,
+	badge: int = None,
+	sound: str = None,
+	extra: dict = None,
+	expiration: int = None,
+	thread_id: str = None,
+	loc_key: str = None,
+	priority: int = None,
+	collapse_id: str = None,
+	err_func: ErrFunc = None,
+	max_concurrent: int = 100,
+	max_retries: int = 2,
+	connections: int = None,
+) -> Iterator[tuple[str, str]]:
+	"""
+	Generator version of apns_send_bulk_message(), yielding
+	(registration_id, result) pairs in the order the results arrive,
+	so that neither the registration_ids nor the results have to be held in
+	memory all at once.
 	"""
 
-	topic = get_manager().get_apns_topic(application_id)
-	results: Dict[str, str] = {}
+	_check_bulk_options(max_concurrent, max_retries, connections)
+	apns_service, message, notification_request_kwargs = _prepare_bulk_message(
+		alert,
+		content_available=content_available,
+		application_id=application_id,
+		creds=creds,
+		topic=topic,
+		badge=badge,
+		sound=sound,
+		extra=extra,
+		thread_id=thread_id,
+		loc_key=loc_key,
+		priority=priority,
+		collapse_id=collapse_id,
+		err_func=err_func,
+		connections=connections,
+	)
+	registration_ids = _ReadAhead(registration_ids)
+	batches = _send_bulk_async(
+		apns_service,
+		registration_ids,
+		message,
+		notification_request_kwargs,
+		expiration=expiration,
+		max_concurrent=max_concurrent,
+		max_retries=max_retries,
+	)
 	inactive_tokens = []
-	apns_service = APNsService(
-		application_id=application_id, creds=creds, topic=topic, err_func=err_func
+	try:
+		while True:
+			# Each run of the loop schedules at most BULK_CHUNK_SIZE notifications
+			# before yielding a batch, so reading as many ahead never runs dry.
+			registration_ids.fill(BULK_CHUNK_SIZE)
+			try:
+				results, batch_inactive_tokens = apns_service._loop.run_until_complete(
+					batches.__anext__()
+				)
+			except StopAsyncIteration:
+				return
+			inactive_tokens.extend(batch_inactive_tokens)
+			while len(inactive_tokens) >= DEACTIVATION_BATCH_SIZE:
+				apns_deactivate_devices(inactive_tokens[:DEACTIVATION_BATCH_SIZE])
+				del inactive_tokens[:DEACTIVATION_BATCH_SIZE]
+			yield from results
+	finally:
+		# cancels the notifications still in flight if the caller stops early
+		apns_service._loop.run_until_complete(batches.aclose())
+		apns_deactivate_devices(inactive_tokens)
+
+
+async def apns_send_bulk_message_async(
+	registration_ids: Iterable[str],
+	alert: Union[str, Alert],
+	content_available: int = 0,
+	application_id: str = None,
+	creds: Credentials = None,
+	topic: str = None,
+	badge: int = None,
+	sound: str = None,
+	extra: dict = None,
+	expiration: int = None,
+	thread_id: str = None,
+	loc_key: str = None,
+	priority: int = None,
+	collapse_id: str = None,
+	err_func: ErrFunc = None,
+	max_concurrent: int = 100,
+	max_retries: int = 2,
+	connections: int = None,
+):
+	"""
+	Coroutine version of apns_send_bulk_message(), for use from code that
+	is already running inside an event loop (e.g. async views).
+	The registration_ids are read from the event loop, so they cannot be an
+	unevaluated queryset.
+	"""
+
+	_check_bulk_options(max_concurrent, max_retries, connections)
+	apns_service, message, notification_request_kwargs = _prepare_bulk_message(
+		alert,
+		content_available=content_available,
+		application_id=application_id,
+		creds=creds,
+		topic=topic,
+		badge=badge,
+		sound=sound,
+		extra=extra,
+		thread_id=thread_id,
+		loc_key=loc_key,
+		priority=priority,
+		collapse_id=collapse_id,
+		err_func=err_func,
+		connections=connections,
 	)
-	for registration_id in registration_ids:
-		request = apns_service._create_notification_request_from_args(
-			registration_id,
-			alert,
-			badge=badge,
-			sound=sound,
-			extra=extra,
-			expiration=expiration,
-			thread_id=thread_id,
-			loc_key=loc_key,
-			priority=priority,
-			collapse_id=collapse_id,
-			aps_kwargs={'content-available': content_available}
-		)
+	results = {}
+	inactive_tokens = []
+	async for batch_results, batch_inactive_tokens in _send_bulk_async(
+		apns_service,
+		registration_ids,
+		message,
+		notification_request_kwargs,
+		expiration=expiration,
+		max_concurrent=max_concurrent,
+		max_retries=max_retries,
+	):
+		inactive_tokens.extend(batch_inactive_tokens)
+		while len(inactive_tokens) >= DEACTIVATION_BATCH_SIZE:
+			# The notifications still pending keep being sent meanwhile.
+			await sync_to_async(apns_deactivate_devices)(
+				inactive_tokens[:DEACTIVATION_BATCH_SIZE]
+			)
+			del inactive_tokens[:DEACTIVATION_BATCH_SIZE]
+		results.update(batch_results)
+	if inactive_tokens:
+		await sync_to_async(apns_deactivate_devices)(inactive_tokens)
+	return results
 
-		result = apns_service.send_message(request)
-		results[registration_id] = (
-			"Success" if result.is_successful else result.description
-		)
-		if not result.is_successful and result.description == "Unregistered":
-			inactive_tokens.append(registration_id)
 
-	if len(inactive_tokens) > 0:
-		models.APNSDevice.objects.filter(registration_id__in=inactive_tokens).update(
+def apns_deactivate_devices(registration_ids: list[str]):
+	"""
+	Marks the APNSDevices with the given registration_ids as inactive,
+	using a single UPDATE query.
+	"""
+	if len(registration_ids) > 0:
+		models.APNSDevice.objects.filter(registration_id__in=registration_ids).update(
 			active=False
 		)
-	return results
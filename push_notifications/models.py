@@ -135,18 +135,22 @@ class APNSDeviceManager(models.Manager):
 class APNSDeviceQuerySet(models.query.QuerySet):
 	def send_message(self, message, creds=None, **kwargs):
 		if self.exists():
+			# the async backend reads the registration_ids as it sends
+			stream_reg_ids = True
 			try:
 				from .apns_async import apns_send_bulk_message
 			except ImportError:
 				from .apns import apns_send_bulk_message
+				stream_reg_ids = False
 
 			app_ids = self.filter(active=True).order_by("application_id") \
 				.values_list("application_id", flat=True).distinct()
 			res = []
 			for app_id in app_ids:
-				reg_ids = list(self.filter(active=True, application_id=app_id).values_list(
-					"registration_id", flat=True)
+				reg_ids = self.filter(active=True, application_id=app_id).values_list(
+					"registration_id", flat=True
 				)
+				reg_ids = reg_ids.iterator() if stream_reg_ids else list(reg_ids)
 				r = apns_send_bulk_message(
 					registration_ids=reg_ids, alert=message, application_id=app_id,
 					creds=creds, **kwargs
@@ -18,6 +18,7 @@ else:
 	PUSH_NOTIFICATIONS_SETTINGS.setdefault("APNS_USE_SANDBOX", False)
 PUSH_NOTIFICATIONS_SETTINGS.setdefault("APNS_USE_ALTERNATIVE_PORT", False)
 PUSH_NOTIFICATIONS_SETTINGS.setdefault("APNS_TOPIC", None)
+PUSH_NOTIFICATIONS_SETTINGS.setdefault("APNS_USE_UVLOOP", False)
 
 # WNS
 PUSH_NOTIFICATIONS_SETTINGS.setdefault("WNS_PACKAGE_SECURITY_ID", None)
@@ -8,8 +8,14 @@ from django.test import TestCase, override_settings
 
 
 try:
+	from aioapns import ConnectionError
 	from aioapns.common import NotificationResult
+	from asgiref.sync import async_to_sync
 
+	from push_notifications import apns_async
+	from push_notifications.apns_async import (
+		apns_deactivate_devices, apns_send_bulk_message, apns_send_bulk_message_async
+	)
 	from push_notifications.exceptions import APNSError
 	from push_notifications.models import APNSDevice
 except ModuleNotFoundError:
@@ -23,6 +29,11 @@ except ModuleNotFoundError:
 
 
 class APNSModelTestCase(TestCase):
+	def setUp(self):
+		apns_async._CLIENT_CACHE.clear()
+		for _, services in apns_async._THREAD_LOOPS.values():
+			services.clear()
+
 	def _create_devices(self, devices):
 		for device in devices:
 			APNSDevice.objects.create(registration_id=device)
@@ -49,6 +60,9 @@ class APNSModelTestCase(TestCase):
 		self.assertEqual(req2.message["aps"]["alert"], "Hello world")
 		self.assertAlmostEqual(req1.time_to_live, 3, places=-1)
 		self.assertAlmostEqual(req2.time_to_live, 3, places=-1)
+		self.assertEqual(req1.message["aps"]["content-available"], 0)
+		self.assertNotEqual(req1.notification_id, req2.notification_id)
+		self.assertIs(req1.message, req2.message)
 
 	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
 	def test_apns_send_message_extra(self, mock_apns):
@@ -131,6 +145,43 @@ class APNSModelTestCase(TestCase):
 			else:
 				self.assertTrue(APNSDevice.objects.get(registration_id=token).active)
 
+	def test_apns_send_message_to_queryset_streams_registration_ids(self):
+		devices = ["abc", "def"]
+		self._create_devices(devices)
+
+		def send_bulk_message(registration_ids, **kwargs):
+			# an iterator over the queryset rather than a list
+			self.assertIs(iter(registration_ids), registration_ids)
+			return {registration_id: "Success" for registration_id in registration_ids}
+
+		with mock.patch(
+			"push_notifications.apns_async.apns_send_bulk_message", side_effect=send_bulk_message
+		):
+			[results] = APNSDevice.objects.all().send_message("Hello World!")
+
+		self.assertEqual(results, {"abc": "Success", "def": "Success"})
+
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_apns_send_message_with_deferred_deactivation(self, mock_apns):
+		devices = ["abc", "def"]
+		self._create_devices(devices)
+
+		mock_apns.return_value.send_notification.return_value = NotificationResult(
+			status="400",
+			notification_id="abc",
+			description="Unregistered",
+		)
+		deferred = []
+		for device in APNSDevice.objects.all():
+			with self.assertRaises(APNSError):
+				device.send_message("Hello World!", defer_deactivation=deferred)
+
+		self.assertEqual(deferred, devices)
+		self.assertEqual(APNSDevice.objects.filter(active=True).count(), 2)
+
+		apns_deactivate_devices(deferred)
+		self.assertEqual(APNSDevice.objects.filter(active=True).count(), 0)
+
 	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
 	def test_apns_send_message_to_bulk_devices_with_error(self, mock_apns):
 		# these errors are device specific, device.active will be set false
@@ -164,6 +215,137 @@ class APNSModelTestCase(TestCase):
 			else:
 				self.assertTrue(APNSDevice.objects.get(registration_id=token).active)
 
+	@mock.patch("push_notifications.apns_async.RETRY_BACKOFF", 0)
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_apns_send_message_to_bulk_devices_with_connection_error(self, mock_apns):
+		devices = ["abc", "def", "ghi"]
+		self._create_devices(devices)
+
+		async def send_notification(request):
+			if request.device_token == "def":
+				raise ConnectionError()
+			if request.device_token == "ghi":
+				return NotificationResult(
+					status="400",
+					notification_id="ghi",
+					description="Unregistered",
+				)
+			return NotificationResult(status="200", notification_id="abc")
+
+		mock_apns.return_value.send_notification.side_effect = send_notification
+		mock_apns.return_value.pool = mock.Mock()
+
+		[results] = APNSDevice.objects.all().send_message("Hello World!")
+
+		self.assertEqual(
+			results, {"abc": "Success", "def": "ConnectionError", "ghi": "Unregistered"}
+		)
+		self.assertEqual(len(apns_async._CLIENT_CACHE), 0)
+		mock_apns.return_value.pool.close.assert_not_called()
+		self.assertTrue(APNSDevice.objects.get(registration_id="def").active)
+		self.assertFalse(APNSDevice.objects.get(registration_id="ghi").active)
+
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_apns_send_bulk_message_async(self, mock_apns):
+		devices = ["abc", "def"]
+		self._create_devices(devices)
+
+		mock_apns.return_value.send_notification.side_effect = [
+			NotificationResult(status="200", notification_id="abc"),
+			NotificationResult(
+				status="400",
+				notification_id="def",
+				description="Unregistered",
+			),
+		]
+
+		results = async_to_sync(apns_send_bulk_message_async)(
+			devices, "Hello World!", creds=apns_async.TokenCredentials(
+				key="aaa", key_id="bbb", team_id="ccc"
+			)
+		)
+
+		self.assertEqual(results, {"abc": "Success", "def": "Unregistered"})
+		self.assertTrue(APNSDevice.objects.get(registration_id="abc").active)
+		self.assertFalse(APNSDevice.objects.get(registration_id="def").active)
+
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_apns_send_bulk_message_async_without_unregistered_devices(self, mock_apns):
+		devices = ["abc", "def"]
+		self._create_devices(devices)
+
+		mock_apns.return_value.send_notification.return_value = NotificationResult(
+			status="200", notification_id="abc"
+		)
+
+		with mock.patch(
+			"push_notifications.apns_async.apns_deactivate_devices"
+		) as deactivate:
+			results = async_to_sync(apns_send_bulk_message_async)(
+				devices, "Hello World!", creds=apns_async.TokenCredentials(
+					key="aaa", key_id="bbb", team_id="ccc"
+				)
+			)
+
+		self.assertEqual(results, {"abc": "Success", "def": "Success"})
+		deactivate.assert_not_called()
+
+	@mock.patch("push_notifications.apns_async.DEACTIVATION_BATCH_SIZE", 2)
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_apns_send_bulk_message_deactivates_in_batches(self, mock_apns):
+		devices = ["abc", "def", "ghi"]
+		self._create_devices(devices)
+
+		mock_apns.return_value.send_notification.return_value = NotificationResult(
+			status="400",
+			notification_id="abc",
+			description="Unregistered",
+		)
+
+		with mock.patch(
+			"push_notifications.apns_async.apns_deactivate_devices",
+			wraps=apns_deactivate_devices,
+		) as deactivate:
+			results = async_to_sync(apns_send_bulk_message_async)(
+				devices, "Hello World!", creds=apns_async.TokenCredentials(
+					key="aaa", key_id="bbb", team_id="ccc"
+				)
+			)
+
+		self.assertEqual(list(results), devices)
+		self.assertEqual(
+			[len(call.args[0]) for call in deactivate.call_args_list], [2, 1]
+		)
+		self.assertEqual(APNSDevice.objects.filter(active=True).count(), 0)
+
+	@mock.patch("push_notifications.apns_async.DEACTIVATION_BATCH_SIZE", 2)
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_apns_send_bulk_message_sync_deactivates_in_batches(self, mock_apns):
+		devices = ["abc", "def", "ghi"]
+		self._create_devices(devices)
+
+		mock_apns.return_value.send_notification.return_value = NotificationResult(
+			status="400",
+			notification_id="abc",
+			description="Unregistered",
+		)
+
+		with mock.patch(
+			"push_notifications.apns_async.apns_deactivate_devices",
+			wraps=apns_deactivate_devices,
+		) as deactivate:
+			results = apns_send_bulk_message(
+				devices, "Hello World!", creds=apns_async.TokenCredentials(
+					key="aaa", key_id="bbb", team_id="ccc"
+				)
+			)
+
+		self.assertEqual(results, {token: "Unregistered" for token in devices})
+		self.assertEqual(
+			[len(call.args[0]) for call in deactivate.call_args_list], [2, 1]
+		)
+		self.assertEqual(APNSDevice.objects.filter(active=True).count(), 0)
+
 	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
 	def test_apns_send_messages_different_priority(self, mock_apns):
 		self._create_devices(["abc", "def"])
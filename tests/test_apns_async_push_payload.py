@@ -1,14 +1,26 @@
+import asyncio
 import sys
+import threading
 import time
+from dataclasses import dataclass, fields
 from unittest import mock
 
 import pytest
+from django.core.exceptions import ImproperlyConfigured
 from django.test import TestCase
 
 
 try:
+	from aioapns import ConnectionError
 	from aioapns.common import NotificationResult
-	from push_notifications.apns_async import TokenCredentials, apns_send_message
+	from aioapns.exceptions import MaxAttemptsExceeded
+	from asgiref.sync import async_to_sync
+
+	from push_notifications import apns_async
+	from push_notifications.apns_async import (
+		Alert, APNsService, CertificateCredentials, TokenCredentials, apns_send_bulk_message,
+		apns_send_bulk_message_async, apns_send_bulk_message_iter, apns_send_message
+	)
 except ModuleNotFoundError:
 	# skipping because apns2 is not supported on python 3.10
 	# it uses hyper that imports from collections which were changed in 3.10
@@ -20,6 +32,11 @@ except ModuleNotFoundError:
 
 
 class APNSAsyncPushPayloadTest(TestCase):
+	def setUp(self):
+		apns_async._CLIENT_CACHE.clear()
+		for _, services in apns_async._THREAD_LOOPS.values():
+			services.clear()
+
 	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
 	def test_push_payload(self, mock_apns):
 		apns_send_message(
@@ -156,6 +173,409 @@ class APNSAsyncPushPayloadTest(TestCase):
 		self.assertEqual(req.message["aps"]["alert"], "sample")
 		self.assertEqual(req.collapse_key, "456789")
 
+	def test_event_loop_is_reused_per_thread(self):
+		loop = apns_async._get_event_loop()
+		self.assertIs(apns_async._get_event_loop(), loop)
+
+		other_loops = []
+
+		def get_loop():
+			other_loops.append(apns_async._get_event_loop())
+			other_loops[0].close()
+
+		thread = threading.Thread(target=get_loop)
+		thread.start()
+		thread.join()
+		self.assertIsNot(other_loops[0], loop)
+
+	@mock.patch("push_notifications.apns_async.APNs")
+	def test_client_is_built_on_the_service_loop(self, mock_apns):
+		client_loops = []
+
+		def create_client(**kwargs):
+			client_loops.append(asyncio.get_event_loop())
+			return mock.DEFAULT
+
+		mock_apns.side_effect = create_client
+		errors = []
+
+		def get_services():
+			try:
+				caller_loop = asyncio.new_event_loop()
+				asyncio.set_event_loop(caller_loop)
+				service = APNsService.get_or_create(
+					creds=TokenCredentials(key="k1", key_id="bbb", team_id="ccc"), topic="default"
+				)
+				# the thread's current loop is reused, not replaced
+				self.assertIs(service._loop, caller_loop)
+				self.assertIs(asyncio.get_event_loop(), caller_loop)
+				caller_loop.close()
+
+				# asyncio.run() leaves the thread without a current loop
+				asyncio.run(asyncio.sleep(0))
+				service = APNsService.get_or_create(
+					creds=TokenCredentials(key="k2", key_id="bbb", team_id="ccc"), topic="default"
+				)
+				self.assertEqual(client_loops, [caller_loop, service._loop])
+				with self.assertRaises(RuntimeError):
+					asyncio.get_event_loop()
+				service._loop.close()
+			except Exception as e:
+				errors.append(e)
+
+		thread = threading.Thread(target=get_services)
+		thread.start()
+		thread.join()
+		self.assertEqual(errors, [])
+
+	def test_uvloop_setting(self):
+		uvloop = mock.Mock()
+		with mock.patch.dict(apns_async.SETTINGS, {"APNS_USE_UVLOOP": True}):
+			with mock.patch.dict(sys.modules, {"uvloop": uvloop}):
+				loop = apns_async._new_event_loop()
+			self.assertIs(loop, uvloop.new_event_loop.return_value)
+
+			with mock.patch.dict(sys.modules, {"uvloop": None}):
+				with self.assertRaises(ImproperlyConfigured):
+					apns_async._new_event_loop()
+
+		loop = apns_async._new_event_loop()
+		self.assertIsInstance(loop, asyncio.AbstractEventLoop)
+		loop.close()
+
+	def test_alert_as_dict(self):
+		alert = Alert(title="t1", launch_image="img.png", loc_args=["a", "b"])
+		self.assertEqual(
+			alert.asDict(),
+			{"title": "t1", "launch-image": "img.png", "loc-args": ["a", "b"]},
+		)
+		self.assertEqual(set(Alert._FIELD_MAP), {f.name for f in fields(Alert)})
+
+	def test_credentials_to_kwargs(self):
+		self.assertEqual(
+			TokenCredentials(key="aaa", key_id="bbb", team_id="ccc").to_kwargs(),
+			{"key": "aaa", "key_id": "bbb", "team_id": "ccc"},
+		)
+		self.assertEqual(
+			CertificateCredentials(client_cert="/path/to/cert.pem").to_kwargs(),
+			{"client_cert": "/path/to/cert.pem"},
+		)
+
+		@dataclass
+		class LifetimeTokenCredentials(TokenCredentials):
+			lifetime: int = 60
+
+		self.assertEqual(
+			LifetimeTokenCredentials(key="aaa", key_id="bbb", team_id="ccc").to_kwargs(),
+			{"key": "aaa", "key_id": "bbb", "team_id": "ccc", "lifetime": 60},
+		)
+
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_bulk_max_concurrent(self, mock_apns):
+		in_flight = []
+		peak = []
+
+		async def send_notification(request):
+			in_flight.append(request)
+			peak.append(len(in_flight))
+			await asyncio.sleep(0)
+			in_flight.remove(request)
+			return NotificationResult(request.notification_id, "200")
+
+		mock_apns.return_value.send_notification.side_effect = send_notification
+		results = apns_send_bulk_message(
+			["1", "2", "3", "4", "5"],
+			"sample",
+			creds=TokenCredentials(key="aaa", key_id="bbb", team_id="ccc"),
+			max_concurrent=2,
+		)
+
+		self.assertEqual(results, {token: "Success" for token in "12345"})
+		self.assertEqual(max(peak), 2)
+
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_bulk_invalid_options(self, mock_apns):
+		creds = TokenCredentials(key="aaa", key_id="bbb", team_id="ccc")
+		for kwargs in ({"max_concurrent": 0}, {"max_retries": -1}, {"connections": 0}):
+			with self.assertRaises(ValueError):
+				apns_send_bulk_message(["123"], "sample", creds=creds, **kwargs)
+			with self.assertRaises(ValueError):
+				async_to_sync(apns_send_bulk_message_async)(
+					["123"], "sample", creds=creds, **kwargs
+				)
+
+		mock_apns.assert_not_called()
+
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_client_is_reused(self, mock_apns):
+		creds = TokenCredentials(key="aaa", key_id="bbb", team_id="ccc")
+		apns_send_message("123", "sample", creds=creds)
+		apns_send_message("456", "sample", creds=creds)
+		apns_send_bulk_message(["789"], "sample", creds=creds)
+
+		self.assertEqual(mock_apns.call_count, 1)
+		self.assertEqual(mock_apns.return_value.send_notification.call_count, 3)
+
+		apns_send_message(
+			"123", "sample", creds=TokenCredentials(key="ddd", key_id="bbb", team_id="ccc")
+		)
+		self.assertEqual(mock_apns.call_count, 2)
+
+	@mock.patch("push_notifications.apns_async.BULK_CHUNK_SIZE", 2)
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_bulk_chunks(self, mock_apns):
+		started = []
+		scheduled = []
+
+		async def send_notification(request):
+			started.append(request.device_token)
+			scheduled.append(len(asyncio.all_tasks()))
+			await asyncio.sleep(0)
+			return NotificationResult(request.notification_id, "200")
+
+		mock_apns.return_value.send_notification.side_effect = send_notification
+		results = apns_send_bulk_message(
+			["1", "2", "3", "4", "5"],
+			"sample",
+			creds=TokenCredentials(key="aaa", key_id="bbb", team_id="ccc"),
+		)
+
+		self.assertEqual(list(results), ["1", "2", "3", "4", "5"])
+		self.assertEqual(started, ["1", "2", "3", "4", "5"])
+		# the first chunk starts sending before the rest is scheduled
+		self.assertLess(scheduled[0], 5)
+
+	@mock.patch("push_notifications.apns_async.BULK_CHUNK_SIZE", 3)
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_bulk_window_refills_as_results_arrive(self, mock_apns):
+		started = []
+		started_before_first_result = []
+
+		async def send_notification(request):
+			started.append(request.device_token)
+			if request.device_token == "1":
+				# keep the first notification pending while the others finish
+				for _ in range(100):
+					await asyncio.sleep(0)
+				started_before_first_result.extend(started)
+			return NotificationResult(request.notification_id, "200")
+
+		mock_apns.return_value.send_notification.side_effect = send_notification
+		results = apns_send_bulk_message(
+			["1", "2", "3", "4", "5"],
+			"sample",
+			creds=TokenCredentials(key="aaa", key_id="bbb", team_id="ccc"),
+		)
+
+		self.assertEqual(results, {token: "Success" for token in "12345"})
+		# "4" and "5" were scheduled as "2" and "3" finished, without waiting for "1"
+		self.assertEqual(started_before_first_result, ["1", "2", "3", "4", "5"])
+
+	@mock.patch("push_notifications.apns_async.BULK_CHUNK_SIZE", 2)
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_bulk_iter_streams_registration_ids(self, mock_apns):
+		consumed = []
+
+		def registration_ids():
+			for token in "12345":
+				consumed.append(token)
+				yield token
+
+		mock_apns.return_value.send_notification.return_value = NotificationResult(
+			"123", "200"
+		)
+		results = apns_send_bulk_message_iter(
+			registration_ids(),
+			"sample",
+			creds=TokenCredentials(key="aaa", key_id="bbb", team_id="ccc"),
+		)
+
+		self.assertEqual(next(results), ("1", "Success"))
+		self.assertEqual(consumed, ["1", "2"])
+		self.assertEqual(mock_apns.return_value.send_notification.call_count, 2)
+		self.assertEqual(list(results), [(token, "Success") for token in "2345"])
+
+	@mock.patch("push_notifications.apns_async.RETRY_BACKOFF", 0)
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_bulk_retries_connection_errors(self, mock_apns):
+		mock_apns.return_value.send_notification.side_effect = [
+			ConnectionError(),
+			MaxAttemptsExceeded(),
+			NotificationResult("123", "200"),
+			MaxAttemptsExceeded(),
+			MaxAttemptsExceeded(),
+			MaxAttemptsExceeded(),
+		]
+		mock_apns.return_value.pool = mock.Mock()
+		creds = TokenCredentials(key="aaa", key_id="bbb", team_id="ccc")
+
+		results = apns_send_bulk_message(["123"], "sample", creds=creds)
+		self.assertEqual(results, {"123": "Success"})
+		self.assertEqual(len(apns_async._CLIENT_CACHE), 0)
+		# other callers may still be sending with the evicted client
+		mock_apns.return_value.pool.close.assert_not_called()
+
+		results = apns_send_bulk_message(["456"], "sample", creds=creds, max_retries=2)
+		self.assertEqual(results, {"456": "MaxAttemptsExceeded"})
+		self.assertEqual(mock_apns.return_value.send_notification.call_count, 6)
+
+	@mock.patch("push_notifications.apns_async.RETRY_BACKOFF", 0)
+	@mock.patch("push_notifications.apns_async.BULK_CHUNK_SIZE", 2)
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_bulk_keeps_sending_after_retries_run_out(self, mock_apns):
+		sent = []
+
+		async def send_notification(request):
+			sent.append(request.device_token)
+			if request.device_token == "1":
+				raise ConnectionError()
+			return NotificationResult(request.notification_id, "200")
+
+		mock_apns.return_value.send_notification.side_effect = send_notification
+
+		results = apns_send_bulk_message(
+			["1", "2", "3", "4", "5"],
+			"sample",
+			creds=TokenCredentials(key="aaa", key_id="bbb", team_id="ccc"),
+			max_concurrent=1,
+			max_retries=1,
+		)
+
+		self.assertEqual(results, {
+			"1": "ConnectionError", "2": "Success", "3": "Success", "4": "Success", "5": "Success"
+		})
+		# "2" is sent while "1" waits to be retried, and the others are still
+		# sent after "1" has run out of retries
+		self.assertEqual(sent, ["1", "2", "1", "3", "4", "5"])
+		self.assertEqual(len(apns_async._CLIENT_CACHE), 0)
+
+	@mock.patch("push_notifications.apns_async.BULK_CHUNK_SIZE", 1)
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_bulk_iter_time_to_live(self, mock_apns):
+		now = [1000]
+		mock_apns.return_value.send_notification.return_value = NotificationResult(
+			"123", "200"
+		)
+		with mock.patch("push_notifications.apns_async.time.time", lambda: now[0]):
+			results = apns_send_bulk_message_iter(
+				["123", "456"],
+				"sample",
+				expiration=1100,
+				creds=TokenCredentials(key="aaa", key_id="bbb", team_id="ccc"),
+			)
+			next(results)
+			now[0] = 1060
+			list(results)
+
+		[call1, call2] = mock_apns.return_value.send_notification.call_args_list
+		self.assertEqual(call1.args[0].time_to_live, 100)
+		self.assertEqual(call2.args[0].time_to_live, 40)
+
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_bulk_payload_too_large(self, mock_apns):
+		results = apns_send_bulk_message(
+			["123", "456"],
+			"x" * 4096,
+			creds=TokenCredentials(key="aaa", key_id="bbb", team_id="ccc"),
+		)
+
+		self.assertEqual(results, {"123": "PayloadTooLarge", "456": "PayloadTooLarge"})
+		mock_apns.return_value.send_notification.assert_not_called()
+
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_bulk_connections(self, mock_apns):
+		creds = TokenCredentials(key="aaa", key_id="bbb", team_id="ccc")
+		apns_send_bulk_message(["123"], "sample", creds=creds, connections=3)
+
+		_, kwargs = mock_apns.call_args
+		self.assertEqual(kwargs["max_connections"], 3)
+
+		apns_send_bulk_message(["123"], "sample", creds=creds)
+		_, kwargs = mock_apns.call_args
+		self.assertNotIn("max_connections", kwargs)
+
+	@mock.patch("push_notifications.apns_async.APNs", autospec=True)
+	def test_bulk_topic(self, mock_apns):
+		creds = TokenCredentials(key="aaa", key_id="bbb", team_id="ccc")
+		apns_send_bulk_message(["123"], "sample", creds=creds, topic="com.example.bulk")
+
+		_, kwargs = mock_apns.call_args
+		self.assertEqual(kwargs["topic"], "com.example.bulk")
+
+		async_to_sync(apns_send_bulk_message_async)(
+			["123"], "sample", creds=creds, topic="com.example.async"
+		)
+		_, kwargs = mock_apns.call_args
+		self.assertEqual(kwargs["topic"], "com.example.async")
+
+	@mock.patch("push_notifications.apns_async.CLIENT_CACHE_SIZE", 2)
+	@mock.patch("push_notifications.apns_async.APNs")
+	def test_client_cache_eviction(self, mock_apns):
+		def get_service(key):
+			return APNsService.get_or_create(
+				creds=TokenCredentials(key=key, key_id="bbb", team_id="ccc"), topic="default"
+			)
+
+		services = [get_service(key) for key in ("k1", "k2", "k1", "k3")]
+
+		self.assertIs(services[0], services[2])
+		self.assertEqual(len(apns_async._CLIENT_CACHE), 2)
+		self.assertNotIn(services[1], apns_async._CLIENT_CACHE.values())
+		# the evicted client may still be in use
+		mock_apns.return_value.pool.close.assert_not_called()
+
+		# the limit applies to the services of each event loop
+		async def get_loop_service(key):
+			return get_service(key)
+
+		loop = asyncio.new_event_loop()
+		loop_services = [
+			loop.run_until_complete(get_loop_service(key)) for key in ("k4", "k5")
+		]
+		self.assertEqual(len(apns_async._CLIENT_CACHE), 4)
+		self.assertIn(services[0], apns_async._CLIENT_CACHE.values())
+		self.assertIn(loop_services[0], apns_async._CLIENT_CACHE.values())
+		loop.close()
+
+	@mock.patch("push_notifications.apns_async.APNs")
+	def test_client_cache_drops_closed_loops(self, mock_apns):
+		creds = TokenCredentials(key="aaa", key_id="bbb", team_id="ccc")
+
+		async def get_service():
+			return APNsService.get_or_create(creds=creds, topic="default")
+
+		service = asyncio.run(get_service())
+		self.assertIn(service, apns_async._CLIENT_CACHE.values())
+
+		APNsService.get_or_create(creds=creds, topic="default")
+		self.assertNotIn(service, apns_async._CLIENT_CACHE.values())
+		self.assertEqual(len(apns_async._CLIENT_CACHE), 1)
+
+	@mock.patch("push_notifications.apns_async.APNs")
+	def test_client_cache_closes_exited_threads(self, mock_apns):
+		mock_apns.return_value.pool.connections = []
+		creds = TokenCredentials(key="aaa", key_id="bbb", team_id="ccc")
+		thread_services = []
+
+		thread = threading.Thread(target=lambda: thread_services.append(
+			APNsService.get_or_create(creds=creds, topic="default")
+		))
+		thread.start()
+		thread.join()
+		thread_loop = thread_services[0]._loop
+		self.assertFalse(thread_loop.is_closed())
+
+		service = APNsService.get_or_create(creds=creds, topic="default")
+		self.assertIsNot(service, thread_services[0])
+		self.assertEqual(list(apns_async._CLIENT_CACHE.values()), [service])
+		# the exited thread's loop is run once more to close its connections
+		for _ in range(100):
+			if thread_loop.is_closed():
+				break
+			time.sleep(0.01)
+		self.assertTrue(thread_loop.is_closed())
+		mock_apns.return_value.pool.close.assert_called_once()
+
 	@mock.patch("aioapns.client.APNsCertConnectionPool", autospec=True)
 	@mock.patch("aioapns.client.APNsKeyConnectionPool", autospec=True)
 	def test_aioapns_err_func(self, mock_cert_pool, mock_key_pool):